@@ -3,8 +3,14 @@ from __future__ import absolute_import
 from .matplotlib_latex_bridge import setup_page,\
                                      set_font_sizes, set_font_family,\
                                      set_default_figsize, get_default_figsize,\
-                                     figure_columnwidth, figure_textwidth, figure, \
-                                     get_format_from_latex, show, savefig
+                                     figure_columnwidth, figure_textwidth, figure_include, figure, \
+                                     get_format_from_latex, check_latex, show, savefig
+
+from .layout_cache import set_layout_cache, clear_layout_cache, get_layout_cache_stats
+
+from .budget import savefig_budget
+
+from .planner import find_includes, plan_figures, build_figures
 
 import matplotlib_latex_bridge.formats
 
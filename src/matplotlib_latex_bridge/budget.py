@@ -0,0 +1,272 @@
+"""
+Saving figures within a size budget
+"""
+from __future__ import print_function
+import io
+import os
+import sys
+
+import matplotlib
+import matplotlib.pyplot as plt
+
+
+# candidate encodings for each dpi, from the highest to the lowest quality
+mlb_png_candidates = [{"compress_level": 9}, {"colors": 256}, {"colors": 64}]
+mlb_jpeg_candidates = [{"quality": q} for q in (95, 90, 80, 70, 60)]
+
+# scaling factor between successive dpi candidates
+mlb_dpi_step = 0.75
+
+
+# helper functions
+def get_format(fname, fmt):
+    """
+    Find the format of the output file
+
+    :param fname: file name or file-like object
+    :param fmt: format requested by the user (optional)
+    :return: lowercase format (png, jpeg or pdf)
+    """
+    if fmt is None:
+        fmt = plt.rcParams["savefig.format"]
+        if not hasattr(fname, "write"):
+            ext = os.path.splitext(str(fname))[1]
+            if ext:
+                fmt = ext[1:]
+
+    fmt = fmt.lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt not in ("png", "jpeg", "pdf"):
+        raise ValueError("Size budget is not supported for format {fmt}".format(fmt=fmt))
+
+    return fmt
+
+
+def dpi_candidates(dpi, min_dpi):
+    """
+    List the dpi that can be used, from the highest to the lowest
+
+    :param dpi: requested dpi
+    :param min_dpi: minimum acceptable dpi
+    :return: list of dpi
+    """
+    dpis = []
+    while dpi > min_dpi:
+        dpis.append(dpi)
+        dpi = int(dpi * mlb_dpi_step)
+    dpis.append(min_dpi)
+    return dpis
+
+
+def encoding_candidates(fmt, min_quality=None, min_colors=None):
+    """
+    List the candidate encodings, from the highest to the lowest quality
+
+    :param fmt: png or jpeg
+    :param min_quality: minimum jpeg quality (optional)
+    :param min_colors: minimum number of colors of the png palette (optional)
+    :return: list of candidate encodings
+    """
+    if fmt == "jpeg":
+        if min_quality is None:
+            return mlb_jpeg_candidates
+        return [c for c in mlb_jpeg_candidates if c["quality"] > min_quality] + [{"quality": min_quality}]
+
+    if min_colors is None:
+        return mlb_png_candidates
+    candidates = [c for c in mlb_png_candidates if "colors" not in c or c["colors"] > min_colors]
+    if min_colors <= 256:
+        candidates.append({"colors": min_colors})
+    return candidates
+
+
+def png_info(metadata):
+    """
+    Build the PNG text chunks, like matplotlib does
+
+    :param metadata: metadata passed to savefig (optional)
+    :return: PIL.PngImagePlugin.PngInfo
+    """
+    from PIL.PngImagePlugin import PngInfo
+
+    metadata = dict({"Software": "Matplotlib version{}, https://matplotlib.org/".format(matplotlib.__version__)},
+                    **(metadata or {}))
+    info = PngInfo()
+    for k, v in metadata.items():
+        if v is not None:
+            info.add_text(k, v)
+    return info
+
+
+def encode(image, fmt, options, save_kwargs):
+    """
+    Encode a rendered image
+
+    :param image: image rendered at the chosen dpi (PIL.Image.Image)
+    :param fmt: png or jpeg
+    :param options: one of the candidate encodings
+    :param save_kwargs: other arguments for PIL.Image.Image.save (dpi, pil_kwargs of the user, ...)
+    :return: encoded bytes
+    """
+    from PIL import Image
+
+    buf = io.BytesIO()
+    if fmt == "jpeg":
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        Image.alpha_composite(background, image).convert("RGB").save(buf, format="JPEG",
+                                                                     **dict(save_kwargs, optimize=True, **options))
+    elif "colors" in options:
+        # method 2 (fast octree) is the only one supporting transparency
+        image.quantize(colors=options["colors"], method=2).save(buf, format="PNG",
+                                                                **dict(save_kwargs, optimize=True))
+    else:
+        image.save(buf, format="PNG", **dict(save_kwargs, **options))
+    return buf.getvalue()
+
+
+def write(fname, data):
+    """
+    Write the encoded figure
+
+    :param fname: file name or file-like object
+    :param data: encoded bytes
+    """
+    if hasattr(fname, "write"):
+        fname.write(data)
+    else:
+        with open(fname, "wb") as f:
+            f.write(data)
+
+
+def raster_versions(fig, fmt, dpis, candidates, workers, pil_kwargs=None, metadata=None, **kwargs):
+    """
+    Generate the encoded versions of a figure in a raster format
+
+    The figure is rendered once for each dpi, then all the candidate encodings are computed in parallel.
+
+    :param fig: figure (matplotlib.figure.Figure)
+    :param fmt: png or jpeg
+    :param dpis: dpi candidates
+    :param candidates: candidate encodings
+    :param workers: maximum number of parallel encoders
+    :param pil_kwargs: forwarded to PIL.Image.Image.save, the candidate encodings override them
+    :param metadata: written in the PNG text chunks (ignored for jpeg)
+    :param kwargs: forwarded to Figure.savefig
+    :return: generator of lists of (settings, data), one list for each dpi
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from PIL import Image
+
+    save_kwargs = dict(pil_kwargs or {})
+    if fmt == "png":
+        save_kwargs["pnginfo"] = png_info(metadata)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for dpi in dpis:
+            buf = io.BytesIO()
+            fig.savefig(buf, format="png", dpi=dpi, pil_kwargs={"compress_level": 0}, **kwargs)
+            buf.seek(0)
+            image = Image.open(buf).convert("RGBA")
+
+            dpi_kwargs = dict(save_kwargs, dpi=(dpi, dpi))
+            encoded = executor.map(lambda options: encode(image, fmt, options, dpi_kwargs), candidates)
+            yield [(dict(options, dpi=dpi), data) for options, data in zip(candidates, encoded)]
+
+
+def pdf_versions(fig, dpis, **kwargs):
+    """
+    Generate the encoded versions of a figure in pdf
+
+    The dpi only affects images and rasterized artists, so no more versions are generated once it has no effect on
+    the size of the file.
+
+    :param fig: figure (matplotlib.figure.Figure)
+    :param dpis: dpi candidates
+    :param kwargs: forwarded to Figure.savefig
+    :return: generator of lists of (settings, data), one list for each dpi
+    """
+    previous = None
+    with plt.rc_context({"pdf.compression": 9}):
+        for dpi in dpis:
+            buf = io.BytesIO()
+            fig.savefig(buf, format="pdf", dpi=dpi, **kwargs)
+            data = buf.getvalue()
+            if previous is not None and len(data) == len(previous):
+                return
+            previous = data
+            yield [({"dpi": dpi, "compression": 9}, data)]
+
+
+# public API
+def savefig_budget(fig, fname, max_size, min_dpi=100, min_quality=None, min_colors=None, workers=None, **kwargs):
+    """
+    Save a figure trying to fit it in a given size
+
+    Starting from the requested dpi, the figure is rendered at decreasing dpi (down to min_dpi) and encoded with
+    decreasing quality, until the output fits in max_size:
+
+    - png: maximum compression, then palette quantization with 256 and 64 colors;
+    - jpeg: quality from 95 to 60;
+    - pdf: maximum compression, the dpi only affects images and rasterized artists.
+
+    The quality can be bounded with min_quality (jpeg quality, which is also taken from ``pil_kwargs["quality"]``) and
+    min_colors (size of the png palette, above 256 the palette is never used): the search stops at these values.
+
+    The encodings for each dpi are computed in parallel. If no version fits, the smallest one is saved and a warning
+    is printed.
+
+    For png and jpeg, ``pil_kwargs`` are forwarded to the encoder, but the candidate encodings override them, and
+    ``metadata`` is written only for png.
+
+    :param fig: figure to save (matplotlib.figure.Figure)
+    :param fname: file name or file-like object, the extension of the format is added if the name has none
+    :param max_size: maximum size of the file in bytes
+    :param min_dpi: minimum acceptable dpi
+    :param min_quality: minimum acceptable jpeg quality (optional)
+    :param min_colors: minimum acceptable number of colors of the png palette (optional)
+    :param workers: maximum number of parallel encoders (default: chosen by concurrent.futures)
+    :param kwargs: forwarded to Figure.savefig
+    :return: dictionary with the chosen settings (format, dpi and encoding options) and the final size in bytes
+    """
+    requested_fmt = kwargs.pop("format", None)
+    fmt = get_format(fname, requested_fmt)
+
+    # like matplotlib, add the extension if the file name has none
+    if not hasattr(fname, "write") and not os.path.splitext(str(fname))[1]:
+        fname = "{fname}.{ext}".format(fname=fname, ext=requested_fmt or plt.rcParams["savefig.format"])
+
+    dpi = kwargs.pop("dpi", None)
+    if dpi is None:
+        dpi = plt.rcParams["savefig.dpi"]
+    if dpi == "figure":
+        dpi = fig.dpi
+    dpis = dpi_candidates(int(dpi), min(min_dpi, int(dpi)))
+
+    if fmt == "pdf":
+        versions = pdf_versions(fig, dpis, **kwargs)
+    else:
+        if fmt == "jpeg" and min_quality is None:
+            # the quality requested by the user is the lowest one that can be used
+            min_quality = (kwargs.get("pil_kwargs") or {}).get("quality")
+        candidates = encoding_candidates(fmt, min_quality, min_colors)
+        versions = raster_versions(fig, fmt, dpis, candidates, workers, **kwargs)
+
+    # keep the first version that fits, or the smallest one
+    settings, data = None, None
+    for encoded in versions:
+        fitting = [v for v in encoded if len(v[1]) <= max_size]
+        if fitting:
+            settings, data = fitting[0]
+            break
+        smallest = min(encoded, key=lambda v: len(v[1]))
+        if data is None or len(smallest[1]) < len(data):
+            settings, data = smallest
+
+    if len(data) > max_size:
+        print("Unable to save the figure in {max_size} bytes, saving the smallest version ({size} bytes)".format(
+            max_size=max_size, size=len(data)), file=sys.stderr)
+
+    write(fname, data)
+
+    return dict(settings, format=fmt, size=len(data))
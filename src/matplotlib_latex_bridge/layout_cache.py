@@ -0,0 +1,221 @@
+"""
+Cache for the constrained layout of structurally identical figures
+"""
+import time
+
+try:
+    from matplotlib.layout_engine import ConstrainedLayoutEngine
+except ImportError:  # matplotlib < 3.6
+    ConstrainedLayoutEngine = object
+
+
+mlb_layout_cache_enabled = False
+mlb_layout_cache = {}
+mlb_layout_cache_stats = {"hits": 0, "misses": 0, "bypassed": 0, "hit_time": 0.0, "miss_time": 0.0,
+                          "first_miss_time": 0.0}
+
+
+# helper functions
+def figure_texts(fig):
+    """
+    Return the figure-level texts that are positioned by the constrained layout
+
+    :param fig: figure (matplotlib.figure.Figure)
+    :return: list of texts (suptitle, supxlabel, supylabel), None for the ones that are not present
+    """
+    return [getattr(fig, name, None) for name in ("_suptitle", "_supxlabel", "_supylabel")]
+
+
+def cacheable(fig):
+    """
+    Check if the layout of a figure can be cached
+
+    Only figures whose axes are all placed on a gridspec are cached. Figures with subfigures, colorbars or manually
+    placed axes are always solved.
+
+    :param fig: figure (matplotlib.figure.Figure)
+    :return: True if the layout can be cached
+    """
+    if fig.subfigs:
+        return False
+    return all(ax.get_subplotspec() is not None for ax in fig.axes)
+
+
+def layout_key(fig, params, renderer):
+    """
+    Compute the key of the layout of a figure
+
+    The key contains the figure size, the layout parameters, the subplot structure and the extent of the decorations
+    (labels, tick labels, titles, legends) around each axes.
+
+    :param fig: figure (matplotlib.figure.Figure)
+    :param params: layout engine parameters
+    :param renderer: renderer used to measure the texts
+    :return: hashable key
+    """
+    gridspecs = []
+    axes = []
+    for ax in fig.axes:
+        ss = ax.get_subplotspec()
+        gs = ss.get_gridspec()
+        if gs not in gridspecs:
+            gridspecs.append(gs)
+        if not ax.get_in_layout():
+            axes.append((gridspecs.index(gs), None))
+            continue
+        pos = ax.get_position(original=True).transformed(fig.transFigure)
+        tight = ax.get_tightbbox(renderer, for_layout_only=True)
+        if tight is None:
+            tight = pos
+        margins = (pos.x0 - tight.x0, pos.y0 - tight.y0, tight.x1 - pos.x1, tight.y1 - pos.y1)
+        axes.append((gridspecs.index(gs),
+                     (ss.rowspan.start, ss.rowspan.stop, ss.colspan.start, ss.colspan.stop),
+                     str(ax.get_aspect()),
+                     tuple(round(m, 1) for m in margins)))
+
+    grids = tuple((gs.nrows, gs.ncols, tuple(gs.get_width_ratios() or ()), tuple(gs.get_height_ratios() or ()),
+                   gs.wspace, gs.hspace)
+                  for gs in gridspecs)
+
+    texts = []
+    for text in figure_texts(fig) + list(fig.legends):
+        if text is None or not text.get_visible() or not text.get_in_layout():
+            texts.append(None)
+        else:
+            extent = text.get_window_extent(renderer)
+            texts.append((round(extent.width, 1), round(extent.height, 1)))
+
+    w, h = fig.get_size_inches()
+    return (round(w, 4), round(h, 4), fig.dpi,
+            tuple(sorted((k, str(v)) for k, v in params.items())),
+            grids, tuple(axes), tuple(texts))
+
+
+def store_layout(fig):
+    """
+    Store the current layout of a figure
+
+    :param fig: figure (matplotlib.figure.Figure)
+    :return: positions of the axes and of the figure texts
+    """
+    axes = [ax.get_position(original=True).frozen() if ax.get_in_layout() else None for ax in fig.axes]
+    texts = [(text.get_position(), text.get_verticalalignment()) if text is not None else None
+             for text in figure_texts(fig)]
+    return axes, texts
+
+
+def restore_layout(fig, layout):
+    """
+    Apply a stored layout to a figure
+
+    :param fig: figure (matplotlib.figure.Figure)
+    :param layout: layout returned by store_layout
+    """
+    axes, texts = layout
+    for ax, pos in zip(fig.axes, axes):
+        if pos is not None:
+            # same as the constrained layout, set_position would remove the axes from the layout
+            ax._set_position(pos)
+    for text, stored in zip(figure_texts(fig), texts):
+        if text is not None and stored is not None:
+            text.set_position(stored[0])
+            text.set_verticalalignment(stored[1])
+
+
+class CachedConstrainedLayoutEngine(ConstrainedLayoutEngine):
+    """
+    Constrained layout engine that reuses the layouts solved for structurally identical figures
+
+    The solved layouts are shared by all the figures using this engine.
+    """
+
+    def execute(self, fig):
+        """
+        Reuse a cached layout or perform the constrained layout and store the result
+
+        :param fig: figure to perform the layout on (matplotlib.figure.Figure)
+        """
+        if not cacheable(fig):
+            mlb_layout_cache_stats["bypassed"] += 1
+            return super(CachedConstrainedLayoutEngine, self).execute(fig)
+
+        start = time.perf_counter()
+        key = layout_key(fig, dict(self.get(), compress=self._compress), fig._get_renderer())
+
+        if key in mlb_layout_cache:
+            restore_layout(fig, mlb_layout_cache[key])
+            mlb_layout_cache_stats["hits"] += 1
+            mlb_layout_cache_stats["hit_time"] += time.perf_counter() - start
+            return None
+
+        result = super(CachedConstrainedLayoutEngine, self).execute(fig)
+        mlb_layout_cache[key] = store_layout(fig)
+        elapsed = time.perf_counter() - start
+        if mlb_layout_cache_stats["misses"] == 0:
+            mlb_layout_cache_stats["first_miss_time"] = elapsed
+        mlb_layout_cache_stats["misses"] += 1
+        mlb_layout_cache_stats["miss_time"] += elapsed
+        return result
+
+
+# public API
+def set_layout_cache(enabled=True):
+    """
+    Enable or disable the layout cache
+
+    When enabled, figures created with :func:`matplotlib_latex_bridge.figure_textwidth`,
+    :func:`matplotlib_latex_bridge.figure_columnwidth` and :func:`matplotlib_latex_bridge.figure` while the constrained
+    layout is active reuse the layout solved for figures with the same size, subplot structure and text extents.
+
+    The cache requires matplotlib >= 3.6.
+
+    :param enabled: True if the cache should be used for new figures
+    """
+    global mlb_layout_cache_enabled
+
+    if enabled and ConstrainedLayoutEngine is object:
+        raise RuntimeError("The layout cache requires matplotlib >= 3.6")
+
+    mlb_layout_cache_enabled = enabled
+
+
+def clear_layout_cache():
+    """
+    Remove all the cached layouts and reset the statistics
+    """
+    mlb_layout_cache.clear()
+    for k in mlb_layout_cache_stats:
+        mlb_layout_cache_stats[k] = 0 if k in ("hits", "misses", "bypassed") else 0.0
+
+
+def get_layout_cache_stats():
+    """
+    Return the statistics of the layout cache
+
+    The time saved is a rough estimate: the average layout time of a miss for each hit, minus the time actually
+    spent on the hits (computing the keys and restoring the cached layouts). The first miss includes the warm-up of
+    fonts and renderer, so it is left out of the average when there are other misses.
+
+    :return: dictionary with hits, misses, bypassed (figures that cannot be cached), hit_rate, size (number of cached
+             layouts), hit_time, miss_time and time_saved (in seconds)
+    """
+    hits = mlb_layout_cache_stats["hits"]
+    misses = mlb_layout_cache_stats["misses"]
+
+    time_saved = 0.0
+    if misses > 1:
+        miss_time = (mlb_layout_cache_stats["miss_time"] - mlb_layout_cache_stats["first_miss_time"]) / (misses - 1)
+        time_saved = hits * miss_time - mlb_layout_cache_stats["hit_time"]
+    elif misses == 1:
+        time_saved = hits * mlb_layout_cache_stats["miss_time"] - mlb_layout_cache_stats["hit_time"]
+
+    return {
+        "hits": hits,
+        "misses": misses,
+        "bypassed": mlb_layout_cache_stats["bypassed"],
+        "hit_rate": float(hits) / (hits + misses) if hits + misses > 0 else 0.0,
+        "size": len(mlb_layout_cache),
+        "hit_time": mlb_layout_cache_stats["hit_time"],
+        "miss_time": mlb_layout_cache_stats["miss_time"],
+        "time_saved": time_saved
+    }
@@ -1,4 +1,7 @@
 from __future__ import print_function
+import matplotlib
+import matplotlib._pylab_helpers
+import matplotlib.text
 import matplotlib.pyplot as plt
 import os
 import sys
@@ -8,12 +11,30 @@ import tempfile
 import shutil
 import io
 
+from . import layout_cache as mlb_layout_cache
+from .layout_cache import set_layout_cache
+from .budget import savefig_budget
+from . import planner
+
 
 mlb_initialized = False
 mlb_textwidth = 0.0
 mlb_columnwidth = 0.0
 mlb_defaultw = 6.4
 mlb_defaulth = 4.8
+mlb_mathtext = False
+mlb_mathtext_saved_rc = {}
+mlb_font_sizes = None
+
+# size of a TeX point in PostScript points (used by matplotlib)
+TEX_POINT = 72.0 / 72.27
+
+# rc parameters for the Computer Modern fonts bundled with matplotlib
+mlb_mathtext_rc = {"font.serif": ["cmr10"],
+                   "font.sans-serif": ["cmss10"],
+                   "font.monospace": ["cmtt10"],
+                   "mathtext.fontset": "cm",
+                   "axes.formatter.use_mathtext": True}
 
 
 # helper functions
@@ -59,24 +80,79 @@ def adjust_size(w, h, r=None):
     return w, h
 
 
+def create_figure(w, h, **kwargs):
+    """
+    Create a new figure, using the layout cache if it is enabled
+
+    :param w: width
+    :param h: height
+    :param kwargs: arguments that will be forwarded to matplotlib.pyplot.figure()
+    :return: the new figure (matplotlib.figure.Figure)
+    """
+    if mlb_layout_cache.mlb_layout_cache_enabled and plt.rcParams["figure.constrained_layout.use"] and \
+            not any(k in kwargs for k in ("layout", "constrained_layout", "tight_layout")):
+        kwargs["layout"] = mlb_layout_cache.CachedConstrainedLayoutEngine()
+
+    return plt.figure(figsize=(w, h), **kwargs)
+
+
+def has_latex():
+    """
+    Check if a LaTeX installation is available
+
+    :return: True if the latex executable can be found in the PATH
+    """
+    # this replaces shutils.which (for python < 3.3)
+    return any((os.access(os.path.join(path, "latex"), os.X_OK) and os.path.isfile(os.path.join(path, "latex")))
+               for path in os.environ["PATH"].split(os.pathsep))
+
+
 # public API
-def set_font_family(family='serif', usetex=True):
+def set_font_family(family='serif', usetex=True, mathtext=True):
     """
     Set the default font to match latex
 
     Using LaTex to render text requires a working LaTeX installation.
 
+    If LaTeX rendering is requested but no LaTeX installation is found, the text can be rendered through mathtext
+    with the Computer Modern fonts bundled with matplotlib. Font sizes are then converted from TeX points, so that
+    text extents match the ones of LaTeX. The Computer Modern fonts have no unicode minus sign, so text containing
+    U+2212 will trigger a missing glyph warning (tick labels are not affected, as they are rendered with mathtext).
+
     :param family: font family used in the document
     :param usetex: True if the LaTeX processor should be enabled to render text
+    :param mathtext: True if Computer Modern fonts should be used when LaTeX is requested but not available
     """
+    global mlb_mathtext
+
     plt.rc('font', family=family)
-    # the next line replaces shutils.which (for python < 3.3)
-    haslatex = any((os.access(os.path.join(path, "latex"), os.X_OK) and os.path.isfile(os.path.join(path, "latex")))
-                   for path in os.environ["PATH"].split(os.pathsep))
+    haslatex = has_latex()
     if usetex and not haslatex:
-        print("Requested LaTeX rendering, but no LaTeX installation found, disabling", file=sys.stderr)
+        if mathtext:
+            print("Requested LaTeX rendering, but no LaTeX installation found, using Computer Modern fonts",
+                  file=sys.stderr)
+        else:
+            print("Requested LaTeX rendering, but no LaTeX installation found, disabling", file=sys.stderr)
+
+    use_mathtext = mathtext and usetex and not haslatex
     plt.rc('text', usetex=usetex and haslatex)
 
+    if use_mathtext != mlb_mathtext:
+        if use_mathtext:
+            for k, v in mlb_mathtext_rc.items():
+                mlb_mathtext_saved_rc[k] = plt.rcParams[k]
+                plt.rcParams[k] = list(v) + list(plt.rcParams[k]) if isinstance(v, list) else v
+        else:
+            # restore the values set before switching to Computer Modern
+            for k, v in mlb_mathtext_saved_rc.items():
+                plt.rcParams[k] = v
+            mlb_mathtext_saved_rc.clear()
+        mlb_mathtext = use_mathtext
+
+        # font sizes are in TeX points only when using mathtext
+        if mlb_font_sizes is not None:
+            set_font_sizes(*mlb_font_sizes)
+
 
 def get_default_figsize():
     """
@@ -99,10 +175,14 @@ def set_font_sizes(small=8, medium=10, big=12):
 
     The small and big sizes can be omitted, and they will be computed according to the medium size.
 
+    When text is rendered with the Computer Modern fonts (see :func:`matplotlib_latex_bridge.set_font_family`), sizes
+    are interpreted as TeX points, like in the LaTeX document.
+
     :param small: used for ticks and legends
     :param medium: used for the labels of the axes
     :param big: used for plot titles
     """
+    global mlb_font_sizes
 
     # medium size default is 10
     if medium is None:
@@ -115,6 +195,11 @@ def set_font_sizes(small=8, medium=10, big=12):
     if big is None:
         big = int(12 * medium / 10)
 
+    mlb_font_sizes = (small, medium, big)
+
+    if mlb_mathtext:
+        small, medium, big = small * TEX_POINT, medium * TEX_POINT, big * TEX_POINT
+
     plt.rc('font', size=small)          # controls default text sizes
     plt.rc('axes', labelsize=medium)    # fontsize of the x and y labels
     plt.rc('xtick', labelsize=small)    # fontsize of the tick labels
@@ -139,7 +224,7 @@ def set_default_figsize(w=None, h=None, dpi=400):
     plt.rc('savefig', dpi=dpi)
 
 
-def setup_page(textwidth, columnwidth, fontsize, dpi=400, usetex=True):
+def setup_page(textwidth, columnwidth, fontsize, dpi=400, usetex=True, mathtext=True, layout_cache=False):
     """
     Setup the page defaults
 
@@ -150,6 +235,9 @@ def setup_page(textwidth, columnwidth, fontsize, dpi=400, usetex=True):
     :param fontsize: default font size of the document
     :param dpi: dpi for generated images
     :param usetex: True if the LaTeX processor should be enabled to render text
+    :param mathtext: True if Computer Modern fonts should be used when LaTeX is requested but not available
+    :param layout_cache: True if the layout of structurally identical figures should be reused
+                         (see :func:`matplotlib_latex_bridge.set_layout_cache`)
     """
 
     global mlb_textwidth, mlb_columnwidth, mlb_initialized
@@ -166,9 +254,10 @@ def setup_page(textwidth, columnwidth, fontsize, dpi=400, usetex=True):
 
     # use constrained layout
     plt.rc('figure.constrained_layout', use=True)
+    set_layout_cache(layout_cache)
 
     # match latex fonts
-    set_font_family(usetex=usetex)
+    set_font_family(usetex=usetex, mathtext=mathtext)
 
     mlb_initialized = True
 
@@ -195,7 +284,7 @@ def figure_textwidth(widthp=1.0, height=None, ratio=None, **kwargs):
 
     w, h = adjust_size(widthp * mlb_textwidth, height, ratio)
 
-    return plt.figure(figsize=(w, h), **kwargs)
+    return create_figure(w, h, **kwargs)
 
 
 def figure_columnwidth(widthp=1.0, height=None, ratio=None, **kwargs):
@@ -220,7 +309,36 @@ def figure_columnwidth(widthp=1.0, height=None, ratio=None, **kwargs):
 
     w, h = adjust_size(widthp * mlb_columnwidth, height, ratio)
 
-    return plt.figure(figsize=(w, h), **kwargs)
+    return create_figure(w, h, **kwargs)
+
+
+def figure_include(fname, height=None, ratio=None, **kwargs):
+    """
+    Creates a figure with the width used to include it in the LaTeX document
+
+    The document is searched for ``\\includegraphics[width=<widthp>\\textwidth]{<fname>}`` (or ``\\columnwidth``)
+    and the figure is created with :func:`figure_textwidth` or :func:`figure_columnwidth` accordingly.
+    The LaTeX files are the ones passed by :func:`matplotlib_latex_bridge.build_figures`, or the ones in the current
+    directory. As in LaTeX, the includes are relative to the folder of the root document (the first file) and to the
+    folders given by ``\\graphicspath``.
+
+    :param fname: name of the file where the figure will be saved
+    :param height: height of the figure (optional)
+    :param ratio: proportion of the figure (width / height) (optional, alternative to height)
+    :param kwargs: arguments that will be forwarded to matplotlib.pyplot.figure()
+    :return: the new figure (matplotlib.figure.Figure)
+    """
+    assert_initialized("figure_include")
+
+    path = os.path.abspath(fname)
+    for include in planner.find_includes(planner.document_files()):
+        if planner.included_figure(include, path):
+            if include["width"] == "textwidth":
+                return figure_textwidth(include["widthp"], height, ratio, **kwargs)
+            return figure_columnwidth(include["widthp"], height, ratio, **kwargs)
+
+    print("No include with width found for {fname}, using columnwidth".format(fname=fname), file=sys.stderr)
+    return figure_columnwidth(1.0, height, ratio, **kwargs)
 
 
 def figure(width=None, height=None, ratio=None, **kwargs):
@@ -250,7 +368,7 @@ def figure(width=None, height=None, ratio=None, **kwargs):
     elif mlb_textwidth < w:
         print("Requested width ({}) is larger that textwidth ({})".format(w, mlb_textwidth), file=sys.stderr)
 
-    return plt.figure(figsize=(w, h), **kwargs)
+    return create_figure(w, h, **kwargs)
 
 
 def get_format_from_latex(documentclass, columns=None, papersize=None, fontsize=None, otheroptions=None):
@@ -273,10 +391,7 @@ def get_format_from_latex(documentclass, columns=None, papersize=None, fontsize=
     """
 
     # check for LaTeX
-    haslatex = any((os.access(os.path.join(path, "latex"), os.X_OK) and os.path.isfile(os.path.join(path, "latex")))
-                   for path in os.environ["PATH"].split(os.pathsep))
-
-    if not haslatex:
+    if not has_latex():
         raise RuntimeError("No LaTeX installation found")
 
     # build file content
@@ -351,6 +466,183 @@ columnwidth: \printinunitsof{in}\prntlen{\columnwidth}
     }
 
 
+def collect_latex_strings(figures):
+    """
+    Collect all the strings of the given figures that will be rendered by LaTeX
+
+    Tick labels are generated by matplotlib only when drawing, so they are updated before collecting them.
+
+    :param figures: list of figures (matplotlib.figure.Figure)
+    :return: list of (figure, axes, artist, string) tuples
+    """
+    strings = []
+    for fig in figures:
+        seen = set()
+        # texts of the axes first, then the ones belonging only to the figure
+        for ax in fig.get_axes() + [None]:
+            if ax is not None:
+                for name in ("xaxis", "yaxis", "zaxis"):
+                    axis = getattr(ax, name, None)
+                    if axis is not None:
+                        axis.get_ticklabels(which="both")
+            for text in (ax or fig).findobj(matplotlib.text.Text):
+                if id(text) in seen:
+                    continue
+                seen.add(id(text))
+                string = text.get_text()
+                if not text.get_visible() or not text.get_usetex() or string == "":
+                    continue
+                strings.append((fig, ax, text, string))
+    return strings
+
+
+def run_latex_check(strings, tmpdir):
+    """
+    Process a list of strings in a single LaTeX run
+
+    Every string is written in a separate file, so that runaway arguments end with the file, and it is preceded by a
+    marker in the LaTeX output, so that errors can be associated with it.
+    Each file is processed inside a box: after it, any group or math mode left open by the string is closed, so that
+    it cannot leak into the following strings.
+
+    :param strings: list of (string, fontsize) tuples
+    :param tmpdir: directory where LaTeX will be executed
+    :return: dictionary of errors indexed by position in strings, index of the last string processed
+             (None if LaTeX processed all of them)
+    """
+    lines = [r"\RequirePackage{fix-cm}",
+             r"\documentclass{article}",
+             r"\newcommand{\mathdefault}[1]{#1}",
+             r"\usepackage[utf8]{inputenc}",
+             r"\DeclareUnicodeCharacter{2212}{\ensuremath{-}}",
+             plt.rcParams["text.latex.preamble"],
+             r"\makeatletter",
+             r"\@ifpackageloaded{underscore}{}{\usepackage[strings]{underscore}}",
+             r"\@ifpackageloaded{textcomp}{}{\usepackage{textcomp}}",
+             r"% close the groups left open by a string (at most 100, in case they cannot be closed)",
+             r"\newcount\mlb@count",
+             r"\def\mlb@close{\ifnum\currentgrouplevel>\mlb@level\relax\ifnum\mlb@count>0 %",
+             r"  \global\advance\mlb@count by -1 %",
+             r"  \ifnum\currentgrouptype=9 $\else\ifnum\currentgrouptype=14 \endgroup%",
+             r"  \else\ifnum\currentgrouptype=16 \right.\else\egroup\fi\fi\fi%",
+             r"  \expandafter\expandafter\expandafter\mlb@close\fi\fi}",
+             r"\def\mlbcheck#1{\setbox0\hbox{\edef\mlb@level{\the\currentgrouplevel}\global\mlb@count=100 %",
+             r"  \input{#1}\relax\mlb@close}}",
+             r"\makeatother",
+             r"\begin{document}"]
+
+    for i, (string, fontsize) in enumerate(strings):
+        with io.open(os.path.join(tmpdir, "mlb{i}.tex".format(i=i)), "w", encoding="utf-8") as texfile:
+            texfile.write(u"{{\\fontsize{{{size}}}{{{skip}}}\\selectfont\\rmfamily {string}}}%\n"
+                          .format(size=fontsize, skip=1.25 * fontsize, string=string.replace("\n", " ")))
+        lines.append(r"\message{{mlb-check:{i}^^J}}\mlbcheck{{mlb{i}}}".format(i=i))
+
+    lines.append(r"\message{mlb-check:end^^J}")
+    lines.append(r"\end{document}")
+
+    with io.open(os.path.join(tmpdir, "check.tex"), "w", encoding="utf-8") as texfile:
+        texfile.write(u"\n".join(lines))
+
+    # avoid markers being split on multiple lines
+    env = dict(os.environ, max_print_line="10000")
+    process = subprocess.Popen(["latex", "-interaction=nonstopmode", "check.tex"], cwd=tmpdir, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    latex_output = process.communicate()[0].decode("utf-8", "replace")
+
+    marker = re.compile(r"mlb-check:([0-9]+|end)")
+    errors = {}
+    current = None
+    print_next = False
+    for line in latex_output.split("\n"):
+        m = marker.search(line)
+        if m is not None:
+            if m.groups()[0] == "end":
+                return errors, None
+            current = int(m.groups()[0])
+            print_next = False
+        elif line.startswith("! "):
+            if current is None:
+                raise RuntimeError("LaTeX was not able to process the preamble: {}".format(line[2:]))
+            if current not in errors:
+                errors[current] = line[2:]
+                print_next = True
+        elif print_next and re.match(r"l\.[0-9]+ ", line):
+            # add the context of the first error
+            errors[current] = "{} {}".format(errors[current], line)
+            print_next = False
+
+    if current is None:
+        raise RuntimeError("Something went wrong with the execution of LaTeX")
+
+    return errors, current
+
+
+def check_latex(figures=None, raise_error=True):
+    """
+    Check that all the text of the given figures can be processed by LaTeX
+
+    All the strings rendered with usetex (labels, titles, legends, tick labels, annotations, ...) are collected and
+    checked in a single LaTeX run, without drawing the figures. This allows to detect all the errors of a batch of
+    figures before starting a long rendering.
+
+    Using this function requires a working LaTeX installation.
+
+    :param figures: list of figures to check (default: all the open figures)
+    :param raise_error: True if a RuntimeError listing all the offending strings should be raised
+    :return: list of dictionaries with figure, axes, artist, string and error for each offending string
+    """
+
+    if figures is None:
+        # plt.figure(num) would change the current figure
+        figures = [m.canvas.figure for m in sorted(matplotlib._pylab_helpers.Gcf.get_all_fig_managers(),
+                                                   key=lambda m: m.num)]
+
+    strings = collect_latex_strings(figures)
+    if not strings:
+        return []
+
+    if not has_latex():
+        raise RuntimeError("No LaTeX installation found")
+
+    # create temporary directory to run latex
+    tmpdir = tempfile.mkdtemp()
+
+    # process all strings, restarting after the offending one if LaTeX stops before the end
+    errors = {}
+    pending = list(range(len(strings)))
+    try:
+        while pending:
+            run_errors, last = run_latex_check([(strings[i][3], strings[i][2].get_fontsize()) for i in pending],
+                                               tmpdir)
+            for i, error in run_errors.items():
+                errors[pending[i]] = error
+            if last is None:
+                break
+            errors.setdefault(pending[last], "LaTeX stopped while processing this string")
+            pending = pending[last + 1:]
+    finally:
+        shutil.rmtree(tmpdir)
+
+    report = []
+    for i in sorted(errors):
+        fig, ax, artist, string = strings[i]
+        report.append({"figure": fig,
+                       "axes": ax,
+                       "artist": artist,
+                       "string": string,
+                       "error": errors[i]})
+
+    if report and raise_error:
+        lines = ["LaTeX was not able to process {n} string(s):".format(n=len(report))]
+        for entry in report:
+            lines.append("figure {fig}, {ax}, {artist}: {string!r} ({error})".format(
+                fig=getattr(entry["figure"], "number", entry["figure"]), ax=entry["axes"], artist=entry["artist"],
+                string=entry["string"], error=entry["error"]))
+        raise RuntimeError("\n".join(lines))
+
+    return report
+
+
 def capturelatexerror(fun):
     """
     Decorator to add LaTeX error checking.
@@ -370,11 +662,15 @@ def capturelatexerror(fun):
         sys.stderr = errors
 
         latex_error = None
+        result = None
         try:
-            fun(*args, **kwargs)
+            result = fun(*args, **kwargs)
         except RuntimeError as err:  # Agg
             if latex_error_string in str(err).split('\n')[0]:
                 latex_error = " ".join(str(err).split('\n')[0:2])
+            else:
+                sys.stderr = old_stderr
+                raise
         # restore stderr
         sys.stderr = old_stderr
 
@@ -395,6 +691,8 @@ def capturelatexerror(fun):
         if latex_error:
             raise RuntimeError(latex_error)
 
+        return result
+
     checkingfun.__doc__ = fun.__doc__
 
     return checkingfun
@@ -416,7 +714,21 @@ def savefig(*args, **kwargs):
     """
     Wrapper around pyplot.savefig that filters LaTeX errors
 
+    If ``check=True`` is passed, the text of the current figure is checked with :func:`check_latex` before saving.
+
+    If ``max_size`` (in bytes) is passed, the dpi and the encoding are chosen to fit the file in that size
+    (see :func:`matplotlib_latex_bridge.savefig_budget`, ``min_dpi``, ``min_quality``, ``min_colors`` and ``workers``
+    are forwarded to it).
+
     :param args: forwarded to pyplot.savefig
     :param kwargs: forwarded to pyplot.savefig
+    :return: the chosen settings and the final size if ``max_size`` was passed, None otherwise
     """
+    if kwargs.pop("check", False):
+        check_latex([plt.gcf()])
+
+    max_size = kwargs.pop("max_size", None)
+    if max_size is not None:
+        return savefig_budget(plt.gcf(), *args, max_size=max_size, **kwargs)
+
     plt.savefig(*args, **kwargs)
@@ -0,0 +1,297 @@
+"""
+Build the figures of a LaTeX document at the sizes used by the document
+"""
+from __future__ import print_function
+import glob
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+
+
+# environment variable used to pass the document to the scripts generating the figures
+MLB_DOCUMENT_ENV = "MLB_DOCUMENT"
+
+# graphics formats supported by LaTeX, used when an include has no extension
+graphics_extensions = ("pdf", "png", "jpg", "jpeg", "eps")
+
+include_regex = re.compile(r"\\includegraphics\s*\[([^\]]*)\]\s*\{([^}]*)\}")
+graphicspath_regex = re.compile(r"\\graphicspath\s*\{((?:\s*\{[^}]*\})*)\s*\}")
+width_regex = re.compile(r"width\s*=\s*([0-9]*\.?[0-9]*)\s*\\(textwidth|columnwidth)\b")
+comment_regex = re.compile(r"(?<!\\)%.*")
+
+
+# helper functions
+def same_figure(include, fname):
+    """
+    Check if a file is the one included in the document
+
+    LaTeX allows to omit the extension of included files, in that case any extension matches.
+
+    :param include: absolute path of the included figure, as written in the document
+    :param fname: absolute path of the file
+    :return: True if the file matches the include
+    """
+    if os.path.splitext(include)[1]:
+        return include == fname
+    return include == os.path.splitext(fname)[0]
+
+
+def figure_exists(figure):
+    """
+    Check if an included figure exists
+
+    :param figure: absolute path of the included figure, as written in the document
+    :return: True if the file exists (with any graphics extension if the include has none)
+    """
+    if os.path.splitext(figure)[1]:
+        return os.path.exists(figure)
+    return any(os.path.exists(figure + "." + ext) for ext in graphics_extensions)
+
+
+def included_figure(include, fname):
+    """
+    Check if a file is the one included in the document, in any of the folders searched by LaTeX
+
+    :param include: include returned by find_includes
+    :param fname: absolute path of the file
+    :return: True if the file matches the include
+    """
+    return any(same_figure(candidate, fname) for candidate in include["candidates"])
+
+
+def find_script(include, scripts):
+    """
+    Find the script that generates an included figure
+
+    The scripts are searched for a string containing the name of the figure, preferring the ones passed to a
+    ``savefig`` call. If the include has no extension, only the graphics formats supported by LaTeX are matched.
+
+    :param include: include returned by find_includes
+    :param scripts: list of python scripts
+    :return: script path and figure path (with the extension used by the script), or None, None if no script is found
+    """
+    name = os.path.basename(include["figure"])
+    ext = r"" if os.path.splitext(name)[1] else r"\.(?:{exts})".format(exts="|".join(graphics_extensions))
+    string = r"""["']((?:[^"'\n]*/)?{name}{ext})["']""".format(name=re.escape(name), ext=ext)
+
+    sources = []
+    for script in scripts:
+        with io.open(script, encoding="utf-8") as f:
+            sources.append((script, f.read()))
+
+    for regex in (re.compile(r"savefig\s*\(\s*" + string), re.compile(string)):
+        for script, source in sources:
+            for m in regex.finditer(source):
+                figure = os.path.normpath(os.path.join(os.path.dirname(script), m.groups()[0]))
+                if included_figure(include, figure):
+                    return script, figure
+
+    return None, None
+
+
+def rebuild_reason(figure, script, size, manifest):
+    """
+    Find why a figure has to be rebuilt
+
+    :param figure: path of the figure
+    :param script: path of the script generating it
+    :param size: size of the figure in the document (width and widthp)
+    :param manifest: previous manifest
+    :return: reason for rebuilding, None if the figure is up to date
+    """
+    if not os.path.exists(figure):
+        return "missing"
+    if os.path.getmtime(script) > os.path.getmtime(figure):
+        return "script changed"
+    previous = manifest.get("figures", {}).get(figure)
+    if previous is None:
+        return "size unknown"
+    if not previous["success"]:
+        return "previous build failed"
+    if previous["width"] != size["width"] or previous["widthp"] != size["widthp"]:
+        return "size changed"
+    return None
+
+
+def run_script(script, tex_files):
+    """
+    Run a script generating figures
+
+    :param script: path of the script
+    :param tex_files: list of LaTeX files, passed to the script
+    :return: return code and output of the script
+    """
+    env = dict(os.environ)
+    env[MLB_DOCUMENT_ENV] = os.pathsep.join(os.path.abspath(t) for t in tex_files)
+    process = subprocess.Popen([sys.executable, os.path.basename(script)], cwd=os.path.dirname(script) or ".",
+                               env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate()[0].decode("utf-8", "replace")
+    return process.returncode, output
+
+
+# public API
+def document_files():
+    """
+    Return the LaTeX files of the document
+
+    These are passed by :func:`matplotlib_latex_bridge.build_figures` to the scripts, with the root document first,
+    otherwise the LaTeX files in the current directory are used.
+
+    :return: list of LaTeX files
+    """
+    if os.environ.get(MLB_DOCUMENT_ENV):
+        return os.environ[MLB_DOCUMENT_ENV].split(os.pathsep)
+    return sorted(glob.glob("*.tex"))
+
+
+def find_includes(tex_files, root=None):
+    """
+    Find the figures included with a width relative to the text or the column
+
+    Only includes of the form ``\\includegraphics[width=<widthp>\\textwidth]{<figure>}`` (or ``\\columnwidth``)
+    are considered.
+
+    Like LaTeX, the included files are searched in the folder of the root document (where it is compiled), then in the
+    folders given by ``\\graphicspath``.
+
+    :param tex_files: list of LaTeX files
+    :param root: root document (default: the first LaTeX file)
+    :return: list of dictionaries with tex (file), line, figure (absolute path, as written in the document),
+             candidates (absolute paths searched by LaTeX), width (textwidth or columnwidth) and widthp
+    """
+    if root is None:
+        root = tex_files[0] if tex_files else "."
+    root_dir = os.path.dirname(os.path.abspath(root))
+
+    sources = []
+    folders = [root_dir]
+    for tex in tex_files:
+        with io.open(tex, encoding="utf-8") as f:
+            lines = [comment_regex.sub("", line) for line in f.read().split("\n")]
+        sources.append((tex, lines))
+        for m in graphicspath_regex.finditer("\n".join(lines)):
+            for folder in re.findall(r"\{([^}]*)\}", m.groups()[0]):
+                folder = os.path.normpath(os.path.join(root_dir, folder.strip()))
+                if folder not in folders:
+                    folders.append(folder)
+
+    includes = []
+    for tex, lines in sources:
+        for n, line in enumerate(lines):
+            for m in include_regex.finditer(line):
+                w = width_regex.search(m.groups()[0])
+                if w is None:
+                    continue
+                candidates = [os.path.normpath(os.path.join(folder, m.groups()[1].strip())) for folder in folders]
+                existing = [c for c in candidates if figure_exists(c)]
+                includes.append({"tex": tex,
+                                 "line": n + 1,
+                                 "figure": existing[0] if existing else candidates[0],
+                                 "candidates": candidates,
+                                 "width": w.groups()[1],
+                                 "widthp": float(w.groups()[0]) if w.groups()[0] else 1.0})
+    return includes
+
+
+def plan_figures(tex_files, scripts=None, manifest="mlb_manifest.json", root=None):
+    """
+    Plan the build of the figures of a document
+
+    Each figure included with a width relative to the text or the column is associated with the script that
+    generates it, and it is marked for rebuilding if it is missing, older than its script or if its size in the
+    document changed since the last build.
+
+    :param tex_files: list of LaTeX files
+    :param scripts: list of python scripts generating the figures (default: the scripts in the folders of the LaTeX
+                    files)
+    :param manifest: manifest of the previous build
+    :param root: root document, the included files are relative to its folder (default: the first LaTeX file)
+    :return: dictionary of figures (indexed by path) with tex, line, width, widthp, script (None if no script is
+             found) and reason (None if the figure is up to date)
+    """
+    if scripts is None:
+        scripts = sorted(set(s for tex in tex_files + ([root] if root is not None else [])
+                             for s in glob.glob(os.path.join(os.path.dirname(os.path.abspath(tex)), "*.py"))))
+    scripts = [os.path.abspath(s) for s in scripts]
+
+    previous = {}
+    if manifest is not None and os.path.exists(manifest):
+        with io.open(manifest, encoding="utf-8") as f:
+            previous = json.load(f)
+
+    plan = {}
+    for include in find_includes(tex_files, root):
+        script, figure = find_script(include, scripts)
+        if script is None:
+            print("No script found for {figure} ({tex}:{line})".format(**include), file=sys.stderr)
+            figure = include["figure"]
+
+        if figure in plan:
+            if (plan[figure]["width"], plan[figure]["widthp"]) != (include["width"], include["widthp"]):
+                print("{figure} is included with different sizes, using the first one ({tex}:{line})".format(
+                    figure=figure, tex=plan[figure]["tex"], line=plan[figure]["line"]), file=sys.stderr)
+            continue
+
+        plan[figure] = {"tex": include["tex"],
+                        "line": include["line"],
+                        "width": include["width"],
+                        "widthp": include["widthp"],
+                        "script": script,
+                        "reason": rebuild_reason(figure, script, include, previous) if script is not None
+                        else "no script found"}
+
+    return plan
+
+
+def build_figures(tex_files, scripts=None, manifest="mlb_manifest.json", workers=None, root=None):
+    """
+    Build the missing or stale figures of a document
+
+    The scripts generating the figures to rebuild are run in parallel, each one only once. Scripts should create the
+    figures with :func:`matplotlib_latex_bridge.figure_include`, so that their size is the one used in the document.
+
+    The manifest lists all the included figures, and for each one if it was rebuilt and why (figures without a script
+    are listed as not rebuilt, with reason "no script found").
+
+    :param tex_files: list of LaTeX files
+    :param scripts: list of python scripts generating the figures (see :func:`plan_figures`)
+    :param manifest: path of the manifest to read and update (None to disable it)
+    :param workers: maximum number of scripts run in parallel (default: chosen by concurrent.futures)
+    :param root: root document, the included files are relative to its folder (default: the first LaTeX file)
+    :return: the manifest (dictionary)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    # the root document is passed first to the scripts, see document_files
+    if root is not None:
+        tex_files = [root] + [t for t in tex_files if os.path.abspath(t) != os.path.abspath(root)]
+
+    plan = plan_figures(tex_files, scripts, manifest)
+
+    to_run = sorted(set(entry["script"] for entry in plan.values()
+                        if entry["script"] is not None and entry["reason"] is not None))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = dict(zip(to_run, executor.map(lambda s: run_script(s, tex_files), to_run)))
+
+    for script, (returncode, output) in results.items():
+        if returncode != 0:
+            print("Error while running {script}:\n{output}".format(script=script, output=output), file=sys.stderr)
+
+    figures = {}
+    for figure, entry in plan.items():
+        entry = dict(entry, rebuilt=entry["script"] in results, success=entry["script"] is not None)
+        if entry["rebuilt"]:
+            if entry["reason"] is None:
+                entry["reason"] = "script run for another figure"
+            entry["success"] = results[entry["script"]][0] == 0 and os.path.exists(figure)
+        figures[figure] = entry
+
+    result = {"figures": figures}
+    if manifest is not None:
+        with io.open(manifest, "w", encoding="utf-8") as f:
+            f.write(json.dumps(result, indent=2, sort_keys=True))
+
+    return result
@@ -0,0 +1,96 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import matplotlib.pyplot as plt
+from PIL import Image
+
+import matplotlib_latex_bridge as mlb
+
+
+class TestBudget(unittest.TestCase):
+
+    def setUp(self):
+        mlb.setup_page(usetex=False, **mlb.formats.article_letterpaper_10pt_doublecolumn)
+        mlb.figure_columnwidth()
+        plt.imshow(np.random.RandomState(0).rand(50, 50))
+
+    def tearDown(self):
+        plt.close("all")
+
+    def test_png_budget(self):
+        buf = io.BytesIO()
+        plt.savefig(buf, format="png")
+        full = len(buf.getvalue())
+
+        buf = io.BytesIO()
+        report = mlb.savefig(buf, format="png", max_size=full // 2)
+        self.assertEqual(report["format"], "png")
+        self.assertEqual(report["size"], len(buf.getvalue()))
+        self.assertLessEqual(report["size"], full // 2)
+
+    def test_jpeg_budget(self):
+        buf = io.BytesIO()
+        report = mlb.savefig(buf, format="jpg", max_size=50000)
+        self.assertEqual(report["format"], "jpeg")
+        self.assertIn("quality", report)
+        self.assertLessEqual(report["size"], 50000)
+
+    def test_min_dpi(self):
+        buf = io.BytesIO()
+        report = mlb.savefig(buf, format="png", max_size=100, min_dpi=150)
+        self.assertEqual(report["dpi"], 150)
+        self.assertGreater(report["size"], 100)
+
+    def test_dpi_metadata(self):
+        for fmt in ("png", "jpeg"):
+            buf = io.BytesIO()
+            report = mlb.savefig(buf, format=fmt, max_size=50000)
+            buf.seek(0)
+            dpi = Image.open(buf).info["dpi"]
+            self.assertAlmostEqual(dpi[0], report["dpi"], places=0)
+            self.assertAlmostEqual(dpi[1], report["dpi"], places=0)
+
+    def test_pil_kwargs_and_metadata(self):
+        buf = io.BytesIO()
+        mlb.savefig(buf, format="png", max_size=10 ** 7, pil_kwargs={"optimize": True},
+                    metadata={"Title": "test"})
+        buf.seek(0)
+        self.assertEqual(Image.open(buf).info["Title"], "test")
+
+    def test_quality_floor(self):
+        buf = io.BytesIO()
+        report = mlb.savefig(buf, format="jpeg", max_size=100, min_quality=75)
+        self.assertEqual(report["quality"], 75)
+
+        buf = io.BytesIO()
+        report = mlb.savefig(buf, format="jpeg", max_size=100, pil_kwargs={"quality": 85})
+        self.assertEqual(report["quality"], 85)
+
+        buf = io.BytesIO()
+        report = mlb.savefig(buf, format="png", max_size=100, min_colors=128)
+        self.assertEqual(report["colors"], 128)
+
+        buf = io.BytesIO()
+        report = mlb.savefig(buf, format="png", max_size=100, min_colors=1000)
+        self.assertNotIn("colors", report)
+
+    def test_extension(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            mlb.savefig(os.path.join(tmpdir, "out"), max_size=10 ** 7)
+            mlb.savefig(os.path.join(tmpdir, "out"), format="jpg", max_size=10 ** 7)
+            self.assertEqual(sorted(os.listdir(tmpdir)), ["out.jpg", "out.png"])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            mlb.savefig(io.BytesIO(), format="svg", max_size=1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
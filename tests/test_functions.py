@@ -11,6 +11,7 @@ else:
 
 import matplotlib_latex_bridge as mlb
 import matplotlib
+import matplotlib.pyplot as plt
 
 
 class TestBasics(unittest.TestCase):
@@ -151,6 +152,101 @@ class TestLatex(unittest.TestCase):
         with self.assertRaises(RuntimeError):
             mlb.savefig("shouldnotsave.png")
 
+    def test_check_latex(self):
+        mlb.setup_page(**mlb.formats.article_letterpaper_10pt_doublecolumn)
+        fig = mlb.figure_textwidth()
+        ax = fig.gca()
+        ax.set_xlabel("$x$")
+        ax.set_ylabel("#")
+        ax.set_title(r"$\mathrm{a$")
+
+        errors = mlb.check_latex([fig], raise_error=False)
+        self.assertEqual(sorted(e["string"] for e in errors), sorted(["#", r"$\mathrm{a$"]))
+        for e in errors:
+            self.assertIs(e["figure"], fig)
+            self.assertIs(e["axes"], ax)
+
+        with self.assertRaises(RuntimeError):
+            mlb.check_latex([fig])
+
+        with self.assertRaises(RuntimeError):
+            mlb.savefig("shouldnotsave.png", check=True)
+
+
+class TestCheck(unittest.TestCase):
+
+    def test_check_without_usetex(self):
+        mlb.setup_page(usetex=False, **mlb.formats.article_letterpaper_10pt_doublecolumn)
+        fig = mlb.figure_textwidth()
+        fig.gca().set_xlabel("#")
+        self.assertEqual(mlb.check_latex([fig]), [])
+
+    def test_check_keeps_current_figure(self):
+        plt.close("all")
+        mlb.setup_page(usetex=False, **mlb.formats.article_letterpaper_10pt_doublecolumn)
+        a = mlb.figure_textwidth()
+        b = mlb.figure_textwidth()
+        plt.figure(a.number)
+        self.assertEqual(mlb.check_latex(), [])
+        self.assertIs(plt.gcf(), a)
+        plt.close(a)
+        plt.close(b)
+
+
+class TestMathtext(unittest.TestCase):
+
+    # extents (width, height) in TeX points of the strings typeset by LaTeX in cmr10 at 10pt,
+    # computed from the character dimensions of cmr10.tfm (None if the height is not comparable)
+    reference_extents = {"amplitude": (43.889, 8.889),
+                         "0123456789": (50.0, None),
+                         "time (s)": (34.5, 10.0)}
+
+    @mock.patch('matplotlib_latex_bridge.matplotlib_latex_bridge.has_latex', return_value=False)
+    @mock.patch('sys.stderr', new_callable=StringIO)
+    def test_font_sizes(self, mock_stderr, mock_has_latex):
+        mlb.setup_page(**mlb.formats.article_letterpaper_10pt_doublecolumn)
+        self.assertAlmostEqual(matplotlib.rcParams["axes.labelsize"], 10 * 72.0 / 72.27)
+
+        mlb.set_font_family(mathtext=False)
+        self.assertAlmostEqual(matplotlib.rcParams["axes.labelsize"], 10)
+
+    def test_usetex_disabled(self):
+        mlb.setup_page(usetex=False, **mlb.formats.article_letterpaper_10pt_doublecolumn)
+        self.assertNotIn("cmr10", matplotlib.rcParams["font.serif"])
+        self.assertAlmostEqual(matplotlib.rcParams["axes.labelsize"], 10)
+
+    @mock.patch('matplotlib_latex_bridge.matplotlib_latex_bridge.has_latex', return_value=False)
+    @mock.patch('sys.stderr', new_callable=StringIO)
+    def test_restore_rc(self, mock_stderr, mock_has_latex):
+        mlb.setup_page(usetex=False, **mlb.formats.article_letterpaper_10pt_doublecolumn)
+        matplotlib.rcParams["font.serif"] = ["Times"]
+        matplotlib.rcParams["mathtext.fontset"] = "stix"
+
+        mlb.set_font_family()
+        self.assertEqual(matplotlib.rcParams["font.serif"][0], "cmr10")
+        self.assertEqual(matplotlib.rcParams["mathtext.fontset"], "cm")
+
+        mlb.set_font_family(mathtext=False)
+        self.assertEqual(matplotlib.rcParams["font.serif"], ["Times"])
+        self.assertEqual(matplotlib.rcParams["mathtext.fontset"], "stix")
+
+        matplotlib.rcParams["font.serif"] = matplotlib.rcParamsDefault["font.serif"]
+        matplotlib.rcParams["mathtext.fontset"] = matplotlib.rcParamsDefault["mathtext.fontset"]
+
+    @mock.patch('matplotlib_latex_bridge.matplotlib_latex_bridge.has_latex', return_value=False)
+    @mock.patch('sys.stderr', new_callable=StringIO)
+    def test_reference_extents(self, mock_stderr, mock_has_latex):
+        mlb.setup_page(**mlb.formats.article_letterpaper_10pt_doublecolumn)
+        fig = mlb.figure_columnwidth(dpi=722.7)
+        renderer = fig.canvas.get_renderer()
+
+        for string, (width, height) in self.reference_extents.items():
+            text = fig.text(0, 0.5, string, fontsize=matplotlib.rcParams["axes.labelsize"])
+            extent = text.get_window_extent(renderer)
+            self.assertAlmostEqual(extent.width * 72.27 / fig.dpi, width, delta=0.02 * width)
+            if height is not None:
+                self.assertAlmostEqual(extent.height * 72.27 / fig.dpi, height, delta=0.05 * height)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+import matplotlib.pyplot as plt
+
+import matplotlib_latex_bridge as mlb
+
+
+def make_figure(xlabel="time (s)"):
+    fig = mlb.figure_textwidth(ratio=2.0)
+    axs = fig.subplots(2, 2)
+    for ax in axs.flat:
+        ax.plot(range(10), range(10))
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel("amplitude")
+    fig.suptitle("waveform")
+    fig.canvas.draw()
+    positions = [ax.get_position().bounds for ax in fig.axes]
+    plt.close(fig)
+    return positions
+
+
+class TestLayoutCache(unittest.TestCase):
+
+    def setUp(self):
+        mlb.setup_page(usetex=False, layout_cache=True, **mlb.formats.article_letterpaper_10pt_doublecolumn)
+        mlb.clear_layout_cache()
+
+    def tearDown(self):
+        mlb.set_layout_cache(False)
+
+    def test_hits(self):
+        first = make_figure()
+        second = make_figure()
+        self.assertEqual(first, second)
+
+        stats = mlb.get_layout_cache_stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["size"], 1)
+        self.assertAlmostEqual(stats["hit_rate"], 0.5)
+
+    def test_same_as_solved(self):
+        make_figure()
+        cached = make_figure()
+        mlb.set_layout_cache(False)
+        solved = make_figure()
+        for c, s in zip(cached, solved):
+            for vc, vs in zip(c, s):
+                self.assertAlmostEqual(vc, vs)
+
+    def test_key_changes(self):
+        make_figure()
+        make_figure(xlabel="time\n(s)")
+        stats = mlb.get_layout_cache_stats()
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["hits"], 0)
+
+    def test_bypass_colorbar(self):
+        fig = mlb.figure_columnwidth()
+        im = fig.gca().imshow([[0, 1], [1, 0]])
+        fig.colorbar(im)
+        fig.canvas.draw()
+        plt.close(fig)
+        self.assertEqual(mlb.get_layout_cache_stats()["bypassed"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
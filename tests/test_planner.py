@@ -0,0 +1,140 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+if sys.version_info >= (3, 3):
+    import unittest.mock as mock
+else:
+    import mock
+if sys.version_info >= (3, 0):
+    from io import StringIO
+else:
+    from io import BytesIO as StringIO
+
+import matplotlib_latex_bridge as mlb
+
+
+document = r"""\documentclass[letterpaper, 10pt, twocolumn]{article}
+\usepackage{graphicx}
+\begin{document}
+\includegraphics[width=0.5\textwidth]{half}
+% \includegraphics[width=\textwidth]{commented.png}
+\includegraphics[width=\columnwidth,frame]{column.png}
+\includegraphics[scale=1]{scaled.png}
+\includegraphics[width=0.3\textwidth]{external.pdf}
+\end{document}
+"""
+
+script = """import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib_latex_bridge as mlb
+
+mlb.setup_page(usetex=False, **mlb.formats.article_letterpaper_10pt_doublecolumn)
+
+np.save("half.npy", [0])
+
+fig = mlb.figure_include("half.png")
+with open("half.txt", "w") as f:
+    f.write(str(fig.get_size_inches()[0]))
+plt.savefig("half.png", dpi=10)
+
+mlb.figure_include("column.png")
+plt.savefig("column.png", dpi=10)
+"""
+
+
+class TestPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.tex = os.path.join(self.tmpdir, "doc.tex")
+        self.manifest = os.path.join(self.tmpdir, "manifest.json")
+        with open(self.tex, "w") as f:
+            f.write(document)
+        with open(os.path.join(self.tmpdir, "generate_images.py"), "w") as f:
+            f.write(script)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_find_includes(self):
+        includes = mlb.find_includes([self.tex])
+        self.assertEqual([os.path.basename(i["figure"]) for i in includes], ["half", "column.png", "external.pdf"])
+        self.assertEqual([i["width"] for i in includes], ["textwidth", "columnwidth", "textwidth"])
+        self.assertEqual([i["widthp"] for i in includes], [0.5, 1.0, 0.3])
+        self.assertEqual([i["line"] for i in includes], [4, 6, 8])
+
+    @mock.patch('sys.stderr', new_callable=StringIO)
+    def test_plan(self, mock_stderr):
+        plan = mlb.plan_figures([self.tex], manifest=self.manifest)
+        self.assertEqual(sorted(os.path.basename(k) for k in plan), ["column.png", "external.pdf", "half.png"])
+        self.assertEqual(plan[os.path.join(self.tmpdir, "external.pdf")]["reason"], "no script found")
+        self.assertIn("No script found", mock_stderr.getvalue())
+
+    @mock.patch('sys.stderr', new_callable=StringIO)
+    def test_build(self, mock_stderr):
+        result = mlb.build_figures([self.tex], manifest=self.manifest)
+        self.assertEqual(len(result["figures"]), 3)
+        external = result["figures"].pop(os.path.join(self.tmpdir, "external.pdf"))
+        self.assertFalse(external["rebuilt"])
+        self.assertEqual(external["reason"], "no script found")
+        for entry in result["figures"].values():
+            self.assertTrue(entry["rebuilt"])
+            self.assertTrue(entry["success"])
+            self.assertEqual(entry["reason"], "missing")
+
+        with open(os.path.join(self.tmpdir, "half.txt")) as f:
+            width = float(f.read())
+        self.assertAlmostEqual(width, 0.5 * mlb.formats.article_letterpaper_10pt_doublecolumn["textwidth"])
+
+        # nothing to rebuild
+        result = mlb.build_figures([self.tex], manifest=self.manifest)
+        for entry in result["figures"].values():
+            self.assertFalse(entry["rebuilt"])
+
+        # size changed
+        with open(self.tex, "w") as f:
+            f.write(document.replace("0.5", "0.4"))
+        plan = mlb.plan_figures([self.tex], manifest=self.manifest)
+        reasons = dict((os.path.basename(k), v["reason"]) for k, v in plan.items())
+        self.assertEqual(reasons, {"half.png": "size changed", "column.png": None, "external.pdf": "no script found"})
+
+    @mock.patch('sys.stderr', new_callable=StringIO)
+    def test_input_subdirectory(self, mock_stderr):
+        # the includes are relative to the root document, not to the file containing them
+        os.remove(self.tex)
+        os.mkdir(os.path.join(self.tmpdir, "sections"))
+        main = os.path.join(self.tmpdir, "main.tex")
+        section = os.path.join(self.tmpdir, "sections", "results.tex")
+        with open(main, "w") as f:
+            f.write(document.replace(r"\includegraphics[width=0.5\textwidth]{half}", r"\input{sections/results}")
+                    .replace(r"\begin{document}", "\\graphicspath{{figures/}{sections/}}\n\\begin{document}"))
+        with open(section, "w") as f:
+            f.write(r"\includegraphics[width=0.5\textwidth]{half}" + "\n" +
+                    r"\includegraphics[width=0.2\textwidth]{local.pdf}" + "\n")
+        with open(os.path.join(self.tmpdir, "sections", "local.pdf"), "w") as f:
+            f.write("")
+
+        includes = mlb.find_includes([main, section])
+        figures = dict((os.path.basename(i["figure"]), i) for i in includes)
+        self.assertEqual(figures["half"]["figure"], os.path.join(self.tmpdir, "half"))
+        self.assertEqual(figures["half"]["candidates"], [os.path.join(self.tmpdir, d, "half")
+                                                         for d in ("", "figures", "sections")])
+        # found in a folder of \graphicspath
+        self.assertEqual(figures["local.pdf"]["figure"], os.path.join(self.tmpdir, "sections", "local.pdf"))
+
+        # the same with the root document passed explicitly
+        self.assertEqual(mlb.find_includes([section, main], root=main)[:2], [figures["half"], figures["local.pdf"]])
+
+        result = mlb.build_figures([section], manifest=self.manifest, root=main)
+        entry = result["figures"][os.path.join(self.tmpdir, "half.png")]
+        self.assertTrue(entry["rebuilt"])
+        self.assertTrue(entry["success"])
+        with open(os.path.join(self.tmpdir, "half.txt")) as f:
+            width = float(f.read())
+        self.assertAlmostEqual(width, 0.5 * mlb.formats.article_letterpaper_10pt_doublecolumn["textwidth"])
+
+
+if __name__ == '__main__':
+    unittest.main()